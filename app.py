@@ -1,4 +1,6 @@
 # main.py
+import argparse
+import numpy as np
 from graph import Graph
 
 CSV_ESTACIONES = "transmetro_stations_unique.csv"
@@ -6,7 +8,19 @@ CSV_RUTAS = "transmetro_routes_detailed.csv"
 CACHE_JSON = "cache_distancias.json"
 VELOCIDAD_PROMEDIO = 5  # km/h para estimar tiempos cuando no hay JSON
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulador de rutas Transmetro")
+    parser.add_argument("--estaciones", default=CSV_ESTACIONES, help="CSV de estaciones")
+    parser.add_argument("--rutas", default=CSV_RUTAS, help="CSV de rutas")
+    parser.add_argument("--cache", default=CACHE_JSON, help="JSON con distancias y tiempos reales")
+    parser.add_argument("--no-estimar", dest="estimate_missing_time", action="store_false",
+                        help="no estimar el tiempo de tramos sin dato (cuentan como 0)")
+    parser.add_argument("--plot", choices=["none", "static", "interactive"], default="interactive",
+                        help="cómo dibujar el mapa: nada, matplotlib o plotly")
+    return parser.parse_args(argv)
+
+def main(csv_estaciones=CSV_ESTACIONES, csv_rutas=CSV_RUTAS, cache_json=CACHE_JSON,
+         estimate_missing_time=True, plot="interactive"):
     print("=== 🚍 SIMULADOR DE RUTAS TRANSMETRO ===")
 
     grafo = Graph()
@@ -15,25 +29,32 @@ def main():
     # Cargar estaciones y rutas
     # -------------------------------
     print("\nCargando estaciones...")
-    grafo.cargar_estaciones(CSV_ESTACIONES)
-    print(f"✔ Estaciones cargadas: {len(grafo.nodos)}")
+    grafo.cargar_estaciones(csv_estaciones)
+    print(f"✔ Estaciones cargadas: {len(grafo.id_to_name)}")
 
     print("Cargando rutas...")
-    grafo.cargar_rutas(CSV_RUTAS)
+    grafo.cargar_rutas(csv_rutas)
     print("✔ Rutas cargadas.\n")
 
     # -------------------------------
     # Cargar cache de distancias y tiempos
     # -------------------------------
     print("Cargando distancias y tiempos desde JSON...")
-    grafo.cargar_cache_aristas(CACHE_JSON)
+    grafo.cargar_cache_aristas(cache_json)
     print("✔ Distancias y tiempos cargados.\n")
 
+    dibujar = {
+        "none": None,
+        "static": grafo.dibujar_grafo_estatico,
+        "interactive": grafo.dibujar_grafo,
+    }[plot]
+
     # -------------------------------
     # Dibujar grafo completo
     # -------------------------------
-    print("Dibujando grafo completo con distancias...")
-    grafo.dibujar_grafo()
+    if dibujar:
+        print("Dibujando grafo completo con distancias...")
+        dibujar()
 
     # -------------------------------
     # Pedir origen/destino
@@ -41,7 +62,7 @@ def main():
     origen = input("\nIngrese estación de origen (exacto): ").strip()
     destino = input("Ingrese estación de destino (exacto): ").strip()
 
-    ruta, distancia = grafo.ruta_mas_corta(origen, destino)
+    ruta, distancia, aristas = grafo.ruta_mas_corta(origen, destino, con_aristas=True)
 
     if not ruta:
         print("⚠️ No se encontró ruta entre esas estaciones.")
@@ -54,26 +75,26 @@ def main():
     print(" → ".join(ruta))
     print(f"Distancia total (km): {distancia:.3f}")
 
-    tiempo_total = 0
-    for i in range(len(ruta)-1):
-        a, b = ruta[i], ruta[i+1]
-        t = grafo.aristas[a][b].get("time")
-        if t is None:
-            # si no hay tiempo, estimar con distancia y velocidad promedio
-            dist = grafo.aristas[a][b]["dist"]
-            t = (dist / VELOCIDAD_PROMEDIO) * 60  # minutos
-        tiempo_total += t
+    tiempos = grafo.times[aristas]
+    if estimate_missing_time:
+        # si no hay tiempo, estimar con distancia y velocidad promedio
+        faltantes = (grafo.weights[aristas] / VELOCIDAD_PROMEDIO) * 60  # minutos
+    else:
+        faltantes = 0
+    tiempo_total = float(np.where(tiempos > 0, tiempos, faltantes).sum())
 
     print(f"Tiempo aproximado total (min): {tiempo_total:.1f}")
 
     # -------------------------------
     # Dibujar ruta destacada
     # -------------------------------
-    print("\nDibujando ruta destacada...")
-    grafo.dibujar_grafo(ruta_destacada=ruta)
+    if dibujar:
+        print("\nDibujando ruta destacada...")
+        dibujar(ruta_destacada=ruta)
 
     print("\n✔ Fin del programa.")
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(args.estaciones, args.rutas, args.cache, args.estimate_missing_time, args.plot)
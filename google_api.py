@@ -2,21 +2,87 @@
 import requests
 import json
 import os
+import threading
 import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class _TokenBucket:
+    """
+    Limitador de tasa: hasta `rate` consultas por segundo, con ráfagas
+    de hasta max(1, rate) consultas. Seguro entre hilos.
+    """
+
+    def __init__(self, rate):
+        if rate <= 0:
+            raise ValueError(f"queries_per_second debe ser > 0: {rate}")
+        self.rate = rate
+        self.capacity = max(1, rate)  # con rate < 1 igual debe caber un token
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
 class GoogleAPI:
     """
     Wrapper para Google Distance Matrix con cache.
     - Primero intenta modo 'transit' (transporte público)
     - Si no existe ruta → prueba 'driving'
-    - Cachea cualquier resultado en archivo JSON
+    - Cachea cualquier resultado en archivo JSON (escritura por lotes:
+      usar close() o un bloque `with` para guardar lo pendiente)
     """
 
-    def __init__(self, api_key, cache_file="cache_distancias.json", backoff=0.8):
+    def __init__(self, api_key, cache_file="cache_distancias.json", backoff=None, flush_every=50,
+                 queries_per_second=10, max_workers=8):
+        # backoff: obsoleto y sin efecto; el ritmo lo marca queries_per_second
+        if backoff is not None:
+            warnings.warn("GoogleAPI(backoff=...) ya no tiene efecto; use queries_per_second",
+                          DeprecationWarning, stacklevel=2)
         self.api_key = api_key
         self.cache_file = cache_file
-        self.backoff = backoff
         self.cache = self._load_cache()
+        self._dirty = 0                 # entradas nuevas aún no escritas
+        self._flush_every = flush_every
+        self._lock = threading.Lock()   # protege cache y _dirty entre hilos
+        self._bucket = _TokenBucket(queries_per_second)
+        self.max_workers = max_workers
+
+        # Sesión compartida: reutiliza conexiones TCP/TLS entre consultas e hilos
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=16))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # --------------------------------------
+    # Escribir a disco lo que quede pendiente
+    # --------------------------------------
+    def close(self):
+        with self._lock:
+            if self._dirty:
+                self._save_cache()
+                self._dirty = 0
+        self.session.close()
 
     # --------------------------------------
     # Cargar cache desde archivo
@@ -24,8 +90,9 @@ class GoogleAPI:
     def _load_cache(self):
         if os.path.exists(self.cache_file):
             try:
-                with open(self.cache_file, "r", encoding="utf-8") as f:
-                    return json.load(f)
+                with open(self.cache_file, "rb") as f:
+                    data = f.read()
+                return orjson.loads(data) if orjson else json.loads(data)
             except:
                 return {}
         return {}
@@ -34,9 +101,24 @@ class GoogleAPI:
     # Guardar cache en archivo
     # --------------------------------------
     def _save_cache(self):
+        if orjson:
+            with open(self.cache_file, "wb") as f:
+                f.write(orjson.dumps(self.cache, option=orjson.OPT_INDENT_2))
+            return
         with open(self.cache_file, "w", encoding="utf-8") as f:
             json.dump(self.cache, f, ensure_ascii=False, indent=2)
 
+    # --------------------------------------
+    # Agregar resultado al cache (se escribe por lotes)
+    # --------------------------------------
+    def _store(self, key, dist, t):
+        with self._lock:
+            self.cache[key] = {"dist": dist, "time_min": t}
+            self._dirty += 1
+            if self._dirty >= self._flush_every:
+                self._save_cache()
+                self._dirty = 0
+
     # --------------------------------------
     # Crear clave única para cache
     # --------------------------------------
@@ -59,8 +141,9 @@ class GoogleAPI:
             "language": "es"
         }
 
+        self._bucket.acquire()
         try:
-            resp = requests.get(url, params=params, timeout=15)
+            resp = self.session.get(url, params=params, timeout=15)
             data = resp.json()
         except Exception as e:
             print("❌ Error al consultar Google API:", e)
@@ -102,24 +185,62 @@ class GoogleAPI:
         if not allow_query:
             return None, None
 
+        dist, t = self._query(origen_coord, destino_coord)
+        if dist is not None:
+            self._store(key, dist, t)
+        return dist, t
+
+    # --------------------------------------
+    # Consultar Google: transit y, si falla, driving
+    # --------------------------------------
+    def _query(self, origen_coord, destino_coord):
         # 2) Intento modo TRANSIT
         dist, t, status = self._google_request(origen_coord, destino_coord, "transit")
         if status == "OK":
-            self.cache[key] = {"dist": dist, "time_min": t}
-            self._save_cache()
-            time.sleep(self.backoff)
             return dist, t
 
         # 3) Fallback a DRIVING
         print(f"ℹ️ Transit falló ({status}). Probando 'driving'...")
         dist, t, status2 = self._google_request(origen_coord, destino_coord, "driving")
         if status2 == "OK":
-            self.cache[key] = {"dist": dist, "time_min": t}
-            self._save_cache()
-            time.sleep(self.backoff)
             return dist, t
 
         # 4) Todo falla
         print("❌ No se pudo obtener distancia en ningún modo.")
         return None, None
+
+    # --------------------------------------
+    # Consultar muchos pares en paralelo
+    # --------------------------------------
+    def prefetch_all(self, coord_pairs):
+        """
+        coord_pairs: iterable de (origen_coord, destino_coord) "lat,lon"
+        Consulta en paralelo los pares que no están en cache, respetando
+        queries_per_second, y guarda el archivo una sola vez al final.
+        Retorna: {clave: (dist, tiempo)} de los pares obtenidos
+        """
+
+        pendientes = {}
+        for origen, destino in coord_pairs:
+            key = self._make_key(origen, destino)
+            if key not in self.cache:
+                pendientes.setdefault(key, (origen, destino))
+
+        resultados = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futuros = {key: pool.submit(self._query, o, d) for key, (o, d) in pendientes.items()}
+            for key, fut in futuros.items():
+                dist, t = fut.result()
+                if dist is None:
+                    continue
+                resultados[key] = (dist, t)
+                with self._lock:
+                    self.cache[key] = {"dist": dist, "time_min": t}
+                    self._dirty += 1
+
+        with self._lock:
+            if self._dirty:
+                self._save_cache()
+                self._dirty = 0
+        return resultados
     
\ No newline at end of file
@@ -1,22 +1,209 @@
-import csv
+import functools
 import math
 import json
 import os
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from numba import njit
 import plotly.graph_objects as go
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# A partir de este tamaño el JSON se lee en streaming (si hay ijson)
+CACHE_STREAM_BYTES = 64 * 1024 * 1024
+
 # ---------------------------------------
 # Haversine para distancias aproximadas
 # ---------------------------------------
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000  # metros
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
+def haversine(lat1, lon1, lat2, lon2, _R=6371000.0):
+    # Versión escalar para uso suelto; la carga del grafo usa haversine_np
+    # 2*asin(sqrt(a)) equivale a 2*atan2(sqrt(a), sqrt(1-a)) con una raíz menos
+    p1 = lat1 * 0.017453292519943295  # math.radians en línea
+    p2 = lat2 * 0.017453292519943295
+    dp = p2 - p1
+    dl = (lon2 - lon1) * 0.017453292519943295
+
+    s1 = math.sin(dp * 0.5)
+    s2 = math.sin(dl * 0.5)
+    a = s1*s1 + math.cos(p1)*math.cos(p2)*s2*s2
+    return _R * 2.0 * math.asin(math.sqrt(a))  # metros
+
+def haversine_np(lat1, lon1, lat2, lon2, _R=6371000.0):
+    # Misma fórmula sobre arreglos: una llamada para todas las aristas.
+    # Radianes una sola vez por arreglo y s*s en lugar de **2
+    p1 = lat1 * 0.017453292519943295
+    p2 = lat2 * 0.017453292519943295
+    s1 = np.sin((p2 - p1) * 0.5)
+    s2 = np.sin((lon2 - lon1) * (0.5 * 0.017453292519943295))
+    a = s1*s1 + np.cos(p1)*np.cos(p2)*s2*s2
+    return (_R * 2.0) * np.arcsin(np.sqrt(a))  # metros
+
+# ---------------------------------------
+# Clave entera para comparar coordenadas
+# ---------------------------------------
+def _clave_coord(lat, lon):
+    # Los datos traen hasta 6 decimales; 1e-7 grados evita colisiones
+    return (round(lat * 1e7), round(lon * 1e7))
+
+def _indexar_cache(items):
+    # "lat1,lon1|lat2,lon2" → {(clave1, clave2) ordenadas: datos}
+    canon = {}
+    for clave, datos in items:
+        try:
+            p1, p2 = (_clave_coord(*map(float, p.split(","))) for p in clave.split("|"))
+        except (ValueError, TypeError):
+            # Clave mal formada (p. ej. "1,2,3|4,5"): no coincide con ninguna arista
+            continue
+        canon[(p1, p2) if p1 <= p2 else (p2, p1)] = datos
+    return canon
+
+# ---------------------------------------
+# Dijkstra compilado sobre el CSR
+# ---------------------------------------
+# Montículo indexado: heap[i] es un nodo, pos[nodo] su índice en heap
+# (-1 si no está) y key[nodo] su prioridad. Permite decrease-key, así
+# que cada nodo entra una sola vez.
+@njit(cache=True)
+def _heap_flotar(heap, pos, key, i):
+    nodo = heap[i]
+    k = key[nodo]
+    while i > 0:
+        padre = (i - 1) // 2
+        if key[heap[padre]] <= k:
+            break
+        heap[i] = heap[padre]
+        pos[heap[i]] = i
+        i = padre
+    heap[i] = nodo
+    pos[nodo] = i
+
+@njit(cache=True)
+def _heap_hundir(heap, pos, key, i, size):
+    nodo = heap[i]
+    k = key[nodo]
+    while True:
+        hijo = 2*i + 1
+        if hijo >= size:
+            break
+        if hijo + 1 < size and key[heap[hijo+1]] < key[heap[hijo]]:
+            hijo += 1
+        if key[heap[hijo]] >= k:
+            break
+        heap[i] = heap[hijo]
+        pos[heap[i]] = i
+        i = hijo
+    heap[i] = nodo
+    pos[nodo] = i
+
+@njit(cache=True)
+def _dijkstra_csr(indptr, indices, weights, src, dst):
+    n = len(indptr) - 1
+    dist = np.full(n, np.inf, dtype=np.float32)
+    prev = np.full(n, -1, dtype=np.int32)
+    prev_k = np.full(n, -1, dtype=np.int32)  # offset CSR de la arista prev[v] → v
+    dist[src] = 0.0
+
+    heap = np.empty(n, dtype=np.int32)
+    pos = np.full(n, -1, dtype=np.int32)
+    heap[0] = src
+    pos[src] = 0
+    size = 1
 
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*(math.sin(dlambda/2)**2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c  # metros
+    while size > 0:
+        # Sacar el mínimo
+        u = heap[0]
+        pos[u] = -1
+        size -= 1
+        if size > 0:
+            heap[0] = heap[size]
+            _heap_hundir(heap, pos, dist, 0, size)
+
+        if u == dst:
+            break
+
+        d = dist[u]
+        for k in range(indptr[u], indptr[u+1]):
+            v = indices[k]
+            nd = d + weights[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                prev[v] = u
+                prev_k[v] = k
+                if pos[v] == -1:
+                    heap[size] = v
+                    size += 1
+                    _heap_flotar(heap, pos, dist, size - 1)
+                else:
+                    _heap_flotar(heap, pos, dist, pos[v])
+
+    return prev, prev_k, dist
+
+# ---------------------------------------
+# A* compilado: Dijkstra guiado por una cota inferior h[v] hasta el destino
+# ---------------------------------------
+@njit(cache=True)
+def _astar_csr(indptr, indices, weights, h, src, dst):
+    n = len(indptr) - 1
+    g = np.full(n, np.inf)
+    f = np.full(n, np.inf)  # prioridad: g + h
+    prev = np.full(n, -1, dtype=np.int32)
+    cerrado = np.zeros(n, dtype=np.bool_)
+    g[src] = 0.0
+    f[src] = h[src]
+
+    heap = np.empty(n, dtype=np.int32)
+    pos = np.full(n, -1, dtype=np.int32)
+    heap[0] = src
+    pos[src] = 0
+    size = 1
+
+    while size > 0:
+        u = heap[0]
+        pos[u] = -1
+        size -= 1
+        if size > 0:
+            heap[0] = heap[size]
+            _heap_hundir(heap, pos, f, 0, size)
+
+        if u == dst:
+            break
+        cerrado[u] = True
+
+        for k in range(indptr[u], indptr[u+1]):
+            v = indices[k]
+            if cerrado[v]:
+                continue
+            ng = g[u] + weights[k]
+            if ng < g[v]:
+                g[v] = ng
+                f[v] = ng + h[v]
+                prev[v] = u
+                if pos[v] == -1:
+                    heap[size] = v
+                    size += 1
+                    _heap_flotar(heap, pos, f, size - 1)
+                else:
+                    _heap_flotar(heap, pos, f, pos[v])
+
+    return prev, g[dst]
+
+# ---------------------------------------
+# Segmentos x0, x1, NaN: una sola traza plotly dibuja todas las líneas
+# ---------------------------------------
+def _segmentos(x, y, a, b):
+    nan = np.full(len(a), np.nan)
+    xs = np.column_stack([x[a], x[b], nan]).ravel()
+    ys = np.column_stack([y[a], y[b], nan]).ravel()
+    return xs, ys
 
 # ============================================================
 #                     CLASE GRAPH
@@ -24,58 +211,159 @@ def haversine(lat1, lon1, lat2, lon2):
 class Graph:
 
     def __init__(self):
-        self.nodos = {}      # nombre → {lat, lon}
-        self.coords = {}     # nombre → (lat, lon)
-        self.aristas = {}    # nodo → { destino → {dist, time} }
+        self.name_to_id = {}  # nombre → id entero
+        self.id_to_name = []  # id entero → nombre
+        self.coords_arr = np.empty((0, 2), dtype=np.float64)  # id → (lat, lon)
+
+        # Aristas en formato CSR: los vecinos de u son
+        # indices[indptr[u]:indptr[u+1]], con su dist y time alineados
+        self.indptr = np.zeros(1, dtype=np.int32)
+        self.indices = np.empty(0, dtype=np.uint16)
+        self.weights = np.empty(0, dtype=np.float32)  # km
+        self.times = np.empty(0, dtype=np.float32)    # min (NaN = sin dato)
+
+        self._pendientes = []  # pares (u_id, v_id) aún no volcados al CSR
+
+        self._factor_h = None  # escala de la heurística de A*
+        self._base_fig = None  # mapa plotly sin ruta, se reutiliza entre consultas
+
+        # Memoización de consultas: por par (origen, destino) y por origen
+        self._ruta_mas_corta_cached = functools.lru_cache(maxsize=4096)(self._ruta_mas_corta_impl)
+        self._sssp_cache = OrderedDict()  # src → (dist, prev, prev_k), en orden LRU
+        self._sssp_max = 64
 
     # ---------------------------------------------------------
     # Cargar estaciones desde CSV
     # ---------------------------------------------------------
     def cargar_estaciones(self, archivo):
-        with open(archivo, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                nombre = row["Nombre parada"].strip()
-                try:
-                    lat = float(row["Coordenada Y"])
-                    lon = float(row["Coordenada X"])
-                except:
-                    continue
-                self.nodos[nombre] = {"lat": lat, "lon": lon}
-                self.coords[nombre] = (lat, lon)
-                self.aristas.setdefault(nombre, {})
+        df = pd.read_csv(
+            archivo,
+            usecols=["Nombre parada", "Coordenada Y", "Coordenada X"],
+            dtype={"Nombre parada": str},
+            keep_default_na=False,
+            float_precision="round_trip",
+            encoding="utf-8",
+        )
+        nombres = df["Nombre parada"].str.strip()
+        lat = pd.to_numeric(df["Coordenada Y"], errors="coerce")
+        lon = pd.to_numeric(df["Coordenada X"], errors="coerce")
+
+        # Filas sin coordenadas válidas se descartan
+        validas = (lat.notna() & lon.notna()).to_numpy()
+        nombres = nombres[validas].tolist()
+        latlon = np.column_stack([lat[validas].to_numpy(), lon[validas].to_numpy()])
+
+        # Si un nombre se repite, valen las coordenadas de su última fila
+        ultimas = dict(zip(nombres, range(len(nombres))))
+        for nombre in ultimas:
+            if nombre not in self.name_to_id:
+                self.name_to_id[nombre] = len(self.id_to_name)
+                self.id_to_name.append(nombre)
+
+        coords = np.empty((len(self.id_to_name), 2), dtype=np.float64)
+        coords[:len(self.coords_arr)] = self.coords_arr
+        ids = [self.name_to_id[nombre] for nombre in ultimas]
+        coords[ids] = latlon[list(ultimas.values())]
+        self.coords_arr = coords
+
+        self._finalize()
 
     # ---------------------------------------------------------
     # Cargar rutas desde CSV
     # ---------------------------------------------------------
     def cargar_rutas(self, archivo):
-        rutas_por_nombre = {}
-        with open(archivo, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                ruta = row["Nombre ruta"].strip()
-                parada = row["Nombre parada"].strip()
-                seq = int(row["Secuencia parada"])
-                rutas_por_nombre.setdefault(ruta, []).append((seq, parada))
-
-        for ruta, lista in rutas_por_nombre.items():
-            lista.sort()
-            for i in range(len(lista)-1):
-                a = lista[i][1]
-                b = lista[i+1][1]
-                if a in self.coords and b in self.coords:
-                    self.agregar_arista(a, b)
-
-    # ---------------------------------------------------------
-    # Agregar arista con Haversine como base
+        r = pd.read_csv(
+            archivo,
+            usecols=["Nombre ruta", "Nombre parada", "Secuencia parada"],
+            dtype={"Nombre ruta": str, "Nombre parada": str, "Secuencia parada": np.int64},
+            keep_default_na=False,
+            encoding="utf-8",
+        )
+        r["Nombre ruta"] = r["Nombre ruta"].str.strip()
+        r["Nombre parada"] = r["Nombre parada"].str.strip()
+
+        # Paradas consecutivas de cada ruta forman una arista
+        r = r.sort_values(["Nombre ruta", "Secuencia parada", "Nombre parada"], kind="stable")
+        r["next"] = r.groupby("Nombre ruta", sort=False)["Nombre parada"].shift(-1)
+        r = r.dropna(subset=["next"])
+
+        a = r["Nombre parada"].map(self.name_to_id)
+        b = r["next"].map(self.name_to_id)
+        conocidas = (a.notna() & b.notna()).to_numpy()
+        self._pendientes.extend(zip(a[conocidas].astype(int).tolist(), b[conocidas].astype(int).tolist()))
+
+        self._finalize()
+
+    # ---------------------------------------------------------
+    # Agregar arista (la distancia Haversine se calcula en _finalize)
     # ---------------------------------------------------------
     def agregar_arista(self, a, b):
-        lat1, lon1 = self.coords[a]
-        lat2, lon2 = self.coords[b]
+        self._pendientes.append((self.name_to_id[a], self.name_to_id[b]))
+        self._limpiar_cache_rutas()
+
+    # ---------------------------------------------------------
+    # Volcar aristas pendientes al CSR
+    # ---------------------------------------------------------
+    def _finalize(self):
+        n = len(self.id_to_name)
+        if n > np.iinfo(np.uint16).max + 1:
+            raise ValueError(f"Demasiadas estaciones para ids uint16: {n}")
+        filas_actuales = np.repeat(
+            np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr)
+        )
+        pares = np.array(self._pendientes, dtype=np.int32).reshape(-1, 2)
+
+        # Distancias Haversine de todas las aristas nuevas de una vez
+        latlon = self.coords_arr
+        a, b = pares[:, 0], pares[:, 1]
+        dist = haversine_np(latlon[a, 0], latlon[a, 1], latlon[b, 0], latlon[b, 1]) / 1000  # km
+
+        # Cada par se agrega en ambos sentidos
+        src = np.concatenate([filas_actuales, a, b])
+        dst = np.concatenate([self.indices, b, a])
+        w = np.concatenate([self.weights, dist, dist])
+        t = np.concatenate([self.times, np.full(2 * len(pares), np.nan)])
+
+        # Una sola arista por par (u, v): la última agregada reemplaza a la anterior
+        clave = src.astype(np.int64) * max(n, 1) + dst
+        _, ultimas = np.unique(clave[::-1], return_index=True)
+        orden = (len(clave) - 1 - ultimas)  # np.unique ya deja las claves ordenadas por u
+
+        # float32 basta para km/min con precisión sub-métrica, y uint16 para
+        # los ids: la mitad de bytes por arista en el recorrido de Dijkstra
+        self.indices = dst[orden].astype(np.uint16)
+        self.weights = w[orden].astype(np.float32)
+        self.times = t[orden].astype(np.float32)
+        self.indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src[orden], minlength=n), out=self.indptr[1:])
+        self._pendientes = []
+        self._ordenar_vecinos()
+        self._limpiar_cache_rutas()
+
+    # ---------------------------------------------------------
+    # Ordenar los vecinos de cada fila por peso ascendente
+    # ---------------------------------------------------------
+    def _ordenar_vecinos(self):
+        # Las aristas cortas se relajan primero: el "if nd < dist[v]" del
+        # kernel acierta casi siempre al principio de la fila
+        filas = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        orden = np.lexsort((self.weights, filas))
+        self.indices = self.indices[orden]
+        self.weights = self.weights[orden]
+        self.times = self.times[orden]
+
+    # ---------------------------------------------------------
+    # Volcar aristas pendientes antes de leer el CSR
+    # ---------------------------------------------------------
+    def _asegurar_csr(self):
+        if self._pendientes:
+            self._finalize()
 
-        dist = haversine(lat1, lon1, lat2, lon2) / 1000  # km
-        self.aristas[a][b] = {"dist": dist, "time": None}
-        self.aristas[b][a] = {"dist": dist, "time": None}
+    def _limpiar_cache_rutas(self):
+        self._ruta_mas_corta_cached.cache_clear()
+        self._sssp_cache.clear()
+        self._factor_h = None
+        self._base_fig = None
 
     # ---------------------------------------------------------
     # Cargar distancias y tiempos reales desde JSON
@@ -85,121 +373,229 @@ class Graph:
             print("⚠️ JSON no encontrado:", archivo_json)
             return
 
-        with open(archivo_json, "r", encoding="utf-8") as f:
-            cache = json.load(f)
-
-        # Recorremos todas las aristas y buscamos coincidencia exacta en JSON
-        for a in self.aristas:
-            for b in self.aristas[a]:
-                lat1, lon1 = self.coords[a]
-                lat2, lon2 = self.coords[b]
+        # Las aristas agregadas con agregar_arista deben estar en el CSR
+        self._asegurar_csr()
 
-                # Claves posibles
-                k1 = f"{lat1},{lon1}|{lat2},{lon2}"
-                k2 = f"{lat2},{lon2}|{lat1},{lon1}"
+        # Indexamos el JSON una sola vez por par de coordenadas sin dirección
+        with open(archivo_json, "rb") as f:
+            if ijson is not None and os.path.getsize(archivo_json) > CACHE_STREAM_BYTES:
+                canon = _indexar_cache(ijson.kvitems(f, "", use_float=True))
+            else:
+                data = f.read()
+                cache = orjson.loads(data) if orjson else json.loads(data)
+                canon = _indexar_cache(cache.items())
 
-                datos = None
-                if k1 in cache:
-                    datos = cache[k1]
-                elif k2 in cache:
-                    datos = cache[k2]
+        # Recorremos todas las aristas y buscamos coincidencia exacta en JSON
+        claves = [_clave_coord(lat, lon) for lat, lon in self.coords_arr.tolist()]
+        for u in range(len(self.id_to_name)):
+            c1 = claves[u]
+            for k in range(self.indptr[u], self.indptr[u+1]):
+                c2 = claves[self.indices[k]]
+                datos = canon.get((c1, c2) if c1 <= c2 else (c2, c1))
 
                 if datos:
                     # Actualizamos dist y tiempo desde JSON
-                    self.aristas[a][b]["dist"] = datos.get("dist", self.aristas[a][b]["dist"])
+                    self.weights[k] = datos.get("dist", self.weights[k])
                     t = datos.get("time_min")
                     # Solo asignamos si no es None y > 0
                     if t is not None and t > 0:
-                        self.aristas[a][b]["time"] = t
+                        self.times[k] = t
 
+        self._ordenar_vecinos()
+        self._limpiar_cache_rutas()
         print("✔ Cache de distancias y tiempos cargada correctamente.")
 
     # ---------------------------------------------------------
     # Dijkstra para ruta más corta (por distancia)
     # ---------------------------------------------------------
-    def ruta_mas_corta(self, origen, destino):
+    def ruta_mas_corta(self, origen, destino, con_aristas=False):
+        # con_aristas=True agrega los offsets CSR de las aristas recorridas,
+        # para leer self.weights / self.times de la ruta sin buscar pares
+        sin_ruta = (None, None, None) if con_aristas else (None, None)
+        if origen not in self.name_to_id or destino not in self.name_to_id:
+            return sin_ruta
+        self._asegurar_csr()
+
+        ruta, distancia, aristas = self._ruta_mas_corta_cached(origen, destino)
+        if ruta is None:
+            return sin_ruta
+        if con_aristas:
+            return list(ruta), distancia, aristas
+        return list(ruta), distancia
+
+    def _ruta_mas_corta_impl(self, origen, destino):
+        src = self.name_to_id[origen]
+        dst = self.name_to_id[destino]
+        dist, prev, prev_k = self._sssp(src)
+
+        if dist[dst] == math.inf:
+            return None, None, None
+
+        aristas = []
+        x = dst
+        while prev[x] != -1:
+            aristas.append(prev_k[x])
+            x = prev[x]
+        aristas = np.array(aristas[::-1], dtype=np.int64)
+        aristas.flags.writeable = False  # se comparte desde el cache
+        return tuple(self._reconstruir(prev, dst)), float(dist[dst]), aristas
+
+    def _reconstruir(self, prev, dst):
+        camino = []
+        x = dst
+        while x != -1:
+            camino.append(self.id_to_name[x])
+            x = prev[x]
+        camino.reverse()
+        return camino
+
+    # ---------------------------------------------------------
+    # Árbol de caminos mínimos desde un origen (uno a todos)
+    # ---------------------------------------------------------
+    def _sssp(self, src):
+        if src in self._sssp_cache:
+            self._sssp_cache.move_to_end(src)
+            return self._sssp_cache[src]
+
+        # dst = -1: no se corta al llegar a ningún nodo, se recorre todo el grafo
+        prev, prev_k, dist = _dijkstra_csr(self.indptr, self.indices, self.weights, src, -1)
+        self._sssp_cache[src] = (dist, prev, prev_k)
+        if len(self._sssp_cache) > self._sssp_max:
+            self._sssp_cache.popitem(last=False)
+        return dist, prev, prev_k
+
+    # ---------------------------------------------------------
+    # Dijkstra bidireccional (origen y destino a la vez)
+    # ---------------------------------------------------------
+    def ruta_mas_corta_bidir(self, origen, destino):
         import heapq
-        dist = {n: float("inf") for n in self.aristas}
-        dist[origen] = 0
-        prev = {n: None for n in self.aristas}
-        pq = [(0, origen)]
-
-        while pq:
-            d, u = heapq.heappop(pq)
-            if u == destino:
+        if origen not in self.name_to_id or destino not in self.name_to_id:
+            return None, None
+        self._asegurar_csr()
+
+        src = self.name_to_id[origen]
+        dst = self.name_to_id[destino]
+        if src == dst:
+            return [origen], 0.0
+
+        # Las aristas se agregan en ambos sentidos, así que la búsqueda
+        # hacia atrás puede recorrer el mismo CSR
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        dist = ({src: 0.0}, {dst: 0.0})   # adelante, atrás
+        prev = ({src: -1}, {dst: -1})
+        pq = ([(0.0, src)], [(0.0, dst)])
+        best = math.inf
+        meet = None
+
+        while pq[0] and pq[1]:
+            if pq[0][0][0] + pq[1][0][0] >= best:
                 break
-            if d != dist[u]:
+
+            # Avanzar por la frontera más pequeña
+            lado = 0 if len(pq[0]) <= len(pq[1]) else 1
+            d, u = heapq.heappop(pq[lado])
+            if d != dist[lado][u]:
                 continue
 
-            for v, datos in self.aristas[u].items():
-                w = datos["dist"]
-                if dist[u] + w < dist[v]:
-                    dist[v] = dist[u] + w
-                    prev[v] = u
-                    heapq.heappush(pq, (dist[v], v))
+            dist_lado, prev_lado = dist[lado], prev[lado]
+            dist_otro = dist[1 - lado]
+            for k in range(indptr[u], indptr[u+1]):
+                v = int(indices[k])
+                nd = d + weights[k]
+                if nd < dist_lado.get(v, math.inf):
+                    dist_lado[v] = nd
+                    prev_lado[v] = u
+                    heapq.heappush(pq[lado], (nd, v))
+                    if v in dist_otro and nd + dist_otro[v] < best:
+                        best = nd + dist_otro[v]
+                        meet = v
 
-        if dist[destino] == float("inf"):
+        if meet is None:
             return None, None
 
-        # Reconstruir ruta
+        # Reconstruir solo la ruta que pasa por el punto de encuentro
         camino = []
-        x = destino
-        while x:
-            camino.append(x)
-            x = prev[x]
+        x = meet
+        while x != -1:
+            camino.append(self.id_to_name[x])
+            x = prev[0][x]
         camino.reverse()
-        return camino, dist[destino]
+        x = prev[1][meet]
+        while x != -1:
+            camino.append(self.id_to_name[x])
+            x = prev[1][x]
+        return camino, float(best)
 
     # ---------------------------------------------------------
     # Dibujar grafo con ruta destacada y hover completo
     # ---------------------------------------------------------
     def dibujar_grafo(self, ruta_destacada=None):
-        pos = self.coords
-        fig = go.Figure()
-        usadas = set()
+        # El mapa base se arma una vez; cada ruta solo agrega su traza encima
+        # Volcar antes de mirar _base_fig: _finalize invalida el mapa guardado
+        self._asegurar_csr()
+        if self._base_fig is None:
+            self._base_fig = self._figura_base()
+        base = self._base_fig
+
+        if ruta_destacada:
+            ids = np.array([self.name_to_id[n] for n in ruta_destacada])
+            xs, ys = _segmentos(self.coords_arr[:, 1], self.coords_arr[:, 0], ids[:-1], ids[1:])
+            ruta = go.Scattergl(
+                x=xs,
+                y=ys,
+                mode="lines",
+                line=dict(color="red", width=5),
+                hoverinfo="skip",
+                showlegend=False
+            )
+            # Encima de las aristas, debajo del hover y las estaciones
+            fig = go.Figure(data=[base.data[0], ruta, *base.data[1:]], layout=base.layout)
+        else:
+            fig = go.Figure(base)
+
+        fig.show()
 
-        def es_par_ruta(a, b, ruta):
-            if not ruta:
-                return False
-            for i in range(len(ruta)-1):
-                if (ruta[i] == a and ruta[i+1] == b) or (ruta[i] == b and ruta[i+1] == a):
-                    return True
-            return False
+    def _figura_base(self):
+        lat, lon = self.coords_arr[:, 0], self.coords_arr[:, 1]
+        fig = go.Figure()
+        u, v, k = self._aristas_unicas()
 
         # Aristas
-        for a in self.aristas:
-            for b, datos in self.aristas[a].items():
-                if (b, a) in usadas:
-                    continue
-                usadas.add((a, b))
-
-                x0, y0 = pos[a][1], pos[a][0]
-                x1, y1 = pos[b][1], pos[b][0]
-
-                t = datos.get("time")
-                txt = f"<b>{a} → {b}</b><br>Distancia: {datos['dist']:.3f} km"
-                txt += f"<br>Tiempo: {t:.2f} min" if t else "<br>Tiempo: N/A"
-
-                color = "red" if es_par_ruta(a, b, ruta_destacada) else "blue"
-                width = 5 if color == "red" else 1.5
-
-                fig.add_trace(go.Scatter(
-                    x=[x0, x1],
-                    y=[y0, y1],
-                    mode="lines",
-                    line=dict(color=color, width=width),
-                    hoverinfo="text",
-                    text=[txt],
-                    showlegend=False
-                ))
+        xs, ys = _segmentos(lon, lat, u, v)
+        fig.add_trace(go.Scattergl(
+            x=xs,
+            y=ys,
+            mode="lines",
+            line=dict(color="blue", width=1.5),
+            hoverinfo="skip",
+            showlegend=False
+        ))
+
+        # Hover de aristas en un punto invisible en la mitad de cada una
+        textos = []
+        for a, b, kk in zip(u.tolist(), v.tolist(), k.tolist()):
+            t = self.times[kk]
+            txt = f"<b>{self.id_to_name[a]} → {self.id_to_name[b]}</b><br>Distancia: {self.weights[kk]:.3f} km"
+            txt += f"<br>Tiempo: {t:.2f} min" if t > 0 else "<br>Tiempo: N/A"
+            textos.append(txt)
+
+        fig.add_trace(go.Scattergl(
+            x=(lon[u] + lon[v]) / 2,
+            y=(lat[u] + lat[v]) / 2,
+            mode="markers",
+            marker=dict(size=8, opacity=0),
+            hoverinfo="text",
+            text=textos,
+            showlegend=False
+        ))
 
         # Nodos
         fig.add_trace(go.Scatter(
-            x=[pos[n][1] for n in pos],
-            y=[pos[n][0] for n in pos],
+            x=lon,
+            y=lat,
             mode="markers",
             marker=dict(size=10, color="black"),
-            text=list(pos.keys()),
+            text=self.id_to_name,
             hoverinfo="text",
             name="Estaciones"
         ))
@@ -211,5 +607,82 @@ class Graph:
             width=1200,
             height=900
         )
+        return fig
 
-        fig.show()
+    # ---------------------------------------------------------
+    # A* con Haversine como heurística
+    # ---------------------------------------------------------
+    def ruta_mas_corta_astar(self, origen, destino):
+        if origen not in self.name_to_id or destino not in self.name_to_id:
+            return None, None
+        self._asegurar_csr()
+
+        src = self.name_to_id[origen]
+        dst = self.name_to_id[destino]
+
+        # Las distancias del JSON (redondeadas) pueden quedar un poco por
+        # debajo de la línea recta; escalar h por la menor razón dist/Haversine
+        # la mantiene admisible y consistente
+        if self._factor_h is None:
+            filas = np.repeat(np.arange(len(self.id_to_name)), np.diff(self.indptr))
+            lat, lon = self.coords_arr[:, 0], self.coords_arr[:, 1]
+            recta = haversine_np(lat[filas], lon[filas], lat[self.indices], lon[self.indices]) / 1000
+            m = recta > 0
+            self._factor_h = float(min(1.0, (self.weights[m] / recta[m]).min(initial=1.0)))
+
+        lat, lon = self.coords_arr[:, 0], self.coords_arr[:, 1]
+        h = self._factor_h * haversine_np(lat, lon, lat[dst], lon[dst]) / 1000  # km
+        prev, distancia = _astar_csr(self.indptr, self.indices, self.weights, h, src, dst)
+
+        if distancia == math.inf:
+            return None, None
+        return self._reconstruir(prev, dst), float(distancia)
+
+    # ---------------------------------------------------------
+    # Aristas sin dirección (u <= v) y las que recorre una ruta
+    # ---------------------------------------------------------
+    def _aristas_unicas(self):
+        filas = np.repeat(np.arange(len(self.id_to_name), dtype=np.int32), np.diff(self.indptr))
+        k = np.flatnonzero(filas <= self.indices)
+        return filas[k], self.indices[k], k
+
+    def _mascara_ruta(self, u, v, ruta):
+        if not ruta:
+            return np.zeros(len(u), dtype=bool)
+        ids = np.array([self.name_to_id[n] for n in ruta], dtype=np.int64)
+        n = max(len(self.id_to_name), 1)
+        a, b = np.minimum(ids[:-1], ids[1:]), np.maximum(ids[:-1], ids[1:])
+        return np.isin(u.astype(np.int64) * n + v, a * n + b)
+
+    # ---------------------------------------------------------
+    # Dibujar grafo estático (matplotlib) con ruta destacada
+    # ---------------------------------------------------------
+    def dibujar_grafo_estatico(self, ruta_destacada=None):
+        # Import local: solo este modo necesita matplotlib
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import LineCollection
+
+        self._asegurar_csr()
+        latlon = self.coords_arr
+        u, v, _ = self._aristas_unicas()
+        en_ruta = self._mascara_ruta(u, v, ruta_destacada)
+
+        # Todas las aristas en una sola colección: segmento = [(lon, lat), (lon, lat)]
+        segs = np.empty((len(u), 2, 2))
+        segs[:, 0, 0], segs[:, 0, 1] = latlon[u, 1], latlon[u, 0]
+        segs[:, 1, 0], segs[:, 1, 1] = latlon[v, 1], latlon[v, 0]
+        colors = np.where(en_ruta, "orange", "blue")
+        widths = np.where(en_ruta, 2.5, 1.0)
+
+        fig, ax = plt.subplots(figsize=(12, 9))
+        ax.add_collection(LineCollection(segs, colors=colors, linewidths=widths, zorder=1))
+        ax.scatter(latlon[:, 1], latlon[:, 0], s=10, c="black", zorder=2)
+
+        # Solo se rotulan las estaciones de la ruta destacada
+        for nombre in ruta_destacada or []:
+            lat, lon = self.coords_arr[self.name_to_id[nombre]]
+            ax.text(lon, lat, nombre, fontsize=7)
+
+        ax.autoscale()
+        ax.set_title("Mapa del sistema Transmetro")
+        plt.show()